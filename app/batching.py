@@ -0,0 +1,32 @@
+"""Coalescing of queued JSON-RPC messages, shared by the stream transports."""
+
+from collections.abc import AsyncIterator
+import anyio
+from anyio.streams.memory import MemoryObjectReceiveStream
+import mcp.types as types
+from pydantic import TypeAdapter
+
+_message_adapter = TypeAdapter(types.JSONRPCMessage)
+
+# Upper bound for coalescing queued messages into a single body chunk
+_MAX_COALESCED_CHUNK_SIZE = 16 * 1024
+
+
+async def iter_message_batches(
+    stream: MemoryObjectReceiveStream[types.JSONRPCMessage],
+) -> AsyncIterator[list[bytes]]:
+    """Yield each message as compact JSON along with any queued behind it."""
+    dump_json = _message_adapter.dump_json
+    async for message in stream:
+        batch = [dump_json(message, by_alias=True, exclude_none=True)]
+        size = len(batch[0])
+        # Drain whatever is already queued so a burst of messages goes out
+        # as one ASGI send instead of one per message.
+        while size < _MAX_COALESCED_CHUNK_SIZE:
+            try:
+                message = stream.receive_nowait()
+            except (anyio.WouldBlock, anyio.EndOfStream):
+                break
+            batch.append(dump_json(message, by_alias=True, exclude_none=True))
+            size += len(batch[-1])
+        yield batch
@@ -4,10 +4,12 @@ from mcp.server.fastmcp import FastMCP
 from starlette.applications import Starlette
 from starlette.routing import Mount, Route
 from contextlib import asynccontextmanager
+from collections.abc import AsyncIterable, AsyncIterator
 from starlette.types import Receive, Scope, Send
-from starlette.responses import StreamingResponse, Response, PlainTextResponse
+from starlette.responses import StreamingResponse, Response
 from starlette.requests import Request
-from uuid import uuid4, UUID
+from starlette.datastructures import URL
+from uuid import uuid4
 import anyio
 from anyio.streams.memory import (
     MemoryObjectReceiveStream,
@@ -15,43 +17,77 @@ from anyio.streams.memory import (
 )
 import mcp.types as types
 import json
+from pydantic import ValidationError
+
+from app.batching import iter_message_batches
+
+
+def _session_id_from_query(query_string: bytes) -> str | None:
+    """Return the ``session_id`` value from a raw query string, if present."""
+    # Session URIs are generated by us, so a plain scan is enough here; no
+    # percent-decoding or multi-dict is needed to find one known key.
+    for pair in query_string.split(b"&"):
+        name, _, value = pair.partition(b"=")
+        if name == b"session_id":
+            return value.decode("latin-1")
+    return None
 
 
 class NDJSONResponse(StreamingResponse):
-    """Streaming response for newline delimited JSON."""
+    """Streaming response for newline delimited JSON.
 
-    def __init__(self, content):
-        super().__init__(content, media_type="application/x-ndjson")
+    ``content`` should yield ``bytes`` so Starlette can write each frame
+    without re-encoding it.
+    """
+
+    def __init__(self, content: AsyncIterable[bytes]) -> None:
+        super().__init__(
+            content,
+            media_type="application/x-ndjson",
+            # Keep proxies (nginx, CDNs) from buffering or re-encoding the
+            # stream, so each frame reaches the client as soon as it is sent
+            headers={
+                "Cache-Control": "no-store, no-transform",
+                "X-Accel-Buffering": "no",
+            },
+        )
 
 
 class HttpStreamServerTransport:
     """Simple HTTP streaming transport using newline delimited JSON."""
 
-    def __init__(self, endpoint: str) -> None:
+    def __init__(self, endpoint: str, max_buffer_size: int = 64) -> None:
         self._endpoint = endpoint
-        self._read_stream_writers: dict[UUID, MemoryObjectSendStream] = {}
+        self._max_buffer_size = max_buffer_size
+        # Keyed by the hex session id exactly as it appears in the session
+        # URI, so POSTs can look it up without parsing a UUID.
+        self._read_stream_writers: dict[str, MemoryObjectSendStream] = {}
 
     async def handle_post_message(
         self, scope: Scope, receive: Receive, send: Send
     ) -> None:
-        request = Request(scope, receive)
-        session_param = request.query_params.get("session_id")
+        session_param = _session_id_from_query(scope.get("query_string", b""))
         if not session_param:
             await Response(status_code=400)(scope, receive, send)
             return
-        session_id = UUID(session_param)
-        writer = self._read_stream_writers.get(session_id)
+        writer = self._read_stream_writers.get(session_param)
         if writer is None:
             await Response(status_code=404)(scope, receive, send)
             return
-        data = await request.json()
-        # TODO: parse JSONRPCMessage correctly when mcp.types is available
-        await writer.send(types.JSONRPCMessage(**data))
+        request = Request(scope, receive)
+        try:
+            # Parse and validate the raw body in one pass in pydantic-core
+            message = types.JSONRPCMessage.model_validate_json(await request.body())
+        except ValidationError as err:
+            await Response(status_code=400)(scope, receive, send)
+            await writer.send(err)
+            return
+        await writer.send(message)
         await Response(status_code=204)(scope, receive, send)
 
     @asynccontextmanager
     async def connect_stream(
-        self, scope: Scope, receive: Receive, send: Send
+        self, scope: Scope, receive: Receive, send: Send, endpoint: str | None = None
     ) -> tuple[
         MemoryObjectReceiveStream[types.JSONRPCMessage | Exception],
         MemoryObjectSendStream[types.JSONRPCMessage],
@@ -59,63 +95,70 @@ class HttpStreamServerTransport:
         if scope["type"] != "http":
             raise ValueError("connect_stream can only handle HTTP requests")
 
-        read_stream_writer, read_stream = anyio.create_memory_object_stream(0)
-        write_stream, write_stream_reader = anyio.create_memory_object_stream(0)
-
-        session_id = uuid4()
-        session_uri = f"{self._endpoint}?session_id={session_id.hex}"
+        read_stream_writer, read_stream = anyio.create_memory_object_stream(
+            self._max_buffer_size
+        )
+        write_stream, write_stream_reader = anyio.create_memory_object_stream(
+            self._max_buffer_size
+        )
+
+        session_id = uuid4().hex
+        # Callers may hand each client an endpoint for the host it connected
+        # through; the session itself always lives in this transport
+        session_uri = f"{endpoint or self._endpoint}?session_id={session_id}"
         self._read_stream_writers[session_id] = read_stream_writer
 
-        async def iter_content():
-            yield json.dumps({"endpoint": session_uri}) + "\n"
-            async for message in write_stream_reader:
-                yield (
-                    json.dumps(
-                        message.model_dump(by_alias=True, exclude_none=True)
-                    )
-                    + "\n"
-                )
-
-        response = NDJSONResponse(iter_content())
-        await response(scope, receive, send)
-        try:
-            yield (read_stream, write_stream)
-        finally:
-            self._read_stream_writers.pop(session_id, None)
+        async def iter_content() -> AsyncIterator[bytes]:
+            yield json.dumps({"endpoint": session_uri}).encode() + b"\n"
+            async for batch in iter_message_batches(write_stream_reader):
+                yield b"\n".join((*batch, b""))
 
+        async with anyio.create_task_group() as tg:
+            response = NDJSONResponse(iter_content())
 
-def create_http_stream_server(mcp: FastMCP) -> Starlette:
-    """Create a Starlette app that handles HTTP streaming connections."""
+            async def run_response():
+                await response(scope, receive, send)
+                # The client has gone away, so stop serving the session too
+                tg.cancel_scope.cancel()
+
+            tg.start_soon(run_response)
+            try:
+                yield (read_stream, write_stream)
+            finally:
+                self._read_stream_writers.pop(session_id, None)
+
+
+class _StreamEndpoint:
+    """ASGI endpoint that serves an MCP session over an NDJSON stream.
 
-    transport: HttpStreamServerTransport | None = None
+    It's a class so ``Route`` passes it the raw ASGI call instead of wrapping
+    it as a request/response function; the stream owns the whole response.
+    """
 
-    async def handle_stream(request: Request):
-        nonlocal transport
-        if transport is None:
-            server_url = f"{request.url.scheme}://{request.url.netloc}"
-            endpoint = f"{server_url}/http/messages/"
-            transport = HttpStreamServerTransport(endpoint)
+    def __init__(self, mcp: FastMCP, transport: HttpStreamServerTransport) -> None:
+        self._mcp = mcp
+        self._transport = transport
 
-        async with transport.connect_stream(
-            request.scope, request.receive, request._send
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        url = URL(scope=scope)
+        endpoint = f"{url.scheme}://{url.netloc}/http/messages/"
+        async with self._transport.connect_stream(
+            scope, receive, send, endpoint=endpoint
         ) as streams:
-            await mcp._mcp_server.run(
-                streams[0], streams[1], mcp._mcp_server.create_initialization_options()
+            server = self._mcp._mcp_server
+            await server.run(
+                streams[0], streams[1], server.create_initialization_options()
             )
 
-    async def handle_messages(scope: Scope, receive: Receive, send: Send):
-        """Handle POST requests once the transport is initialized."""
-        if transport is None:
-            response = PlainTextResponse(
-                "HTTP streaming transport not initialized", status_code=503
-            )
-            await response(scope, receive, send)
-        else:
-            await transport.handle_post_message(scope, receive, send)
+
+def create_http_stream_server(mcp: FastMCP) -> Starlette:
+    """Create a Starlette app that handles HTTP streaming connections."""
+
+    transport = HttpStreamServerTransport("/http/messages/")
 
     routes = [
-        Route("/stream/", endpoint=handle_stream),
-        Mount("/messages/", app=handle_messages),
+        Route("/stream/", endpoint=_StreamEndpoint(mcp, transport), methods=["GET"]),
+        Mount("/messages/", app=transport.handle_post_message),
     ]
 
     return Starlette(routes=routes)
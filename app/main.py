@@ -26,3 +26,11 @@ async def get_dfm_sap(technology: str) -> str:
 def echo_resource(message: str) -> str:
     """Echo a message as a resource"""
     return f"Resource echo: {message}"
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # Sessions live in-process, so stick to a single worker: a POST routed to
+    # another worker would never find the stream it belongs to.
+    uvicorn.run("app.main:app", loop="uvloop", http="httptools", lifespan="on")
@@ -2,30 +2,53 @@ from mcp.server.fastmcp import FastMCP
 from mcp.server.sse import SseServerTransport as BaseSseServerTransport
 from starlette.applications import Starlette
 from starlette.routing import Mount, Route
-from starlette.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 from starlette.types import Receive, Scope, Send
 from uuid import uuid4
 import anyio
-from sse_starlette import EventSourceResponse
+from sse_starlette import EventSourceResponse, ServerSentEvent
 from anyio.streams.memory import MemoryObjectReceiveStream, MemoryObjectSendStream
 import mcp.types as types
 
+from app.batching import iter_message_batches
+
+# Pre-encoded SSE framing, using the same separator EventSourceResponse emits
+# for dict events. Compact JSON never contains a raw newline, so a message
+# always fits on a single data line.
+_MESSAGE_EVENT_PREFIX = b"event: message\r\ndata: "
+_EVENT_SUFFIX = b"\r\n\r\n"
+
 
 class CustomEventSourceResponse(EventSourceResponse):
     """Custom SSE response that uses the correct Content-Type header"""
 
     def __init__(self, *args, **kwargs):
+        # Stop intermediaries from compressing the stream, which makes them
+        # buffer events until enough data has accumulated, unless the caller
+        # chose its own caching policy
+        headers = kwargs["headers"] = dict(kwargs.get("headers") or {})
+        headers.setdefault("Cache-Control", "no-store, no-transform")
         super().__init__(*args, **kwargs)
         # Override the Content-Type header to remove charset
         self.headers["Content-Type"] = "text/event-stream"
+        if self.ping_message_factory is None:
+            # Send the same comment frame on every ping instead of formatting
+            # a timestamp each time; clients ignore comments anyway
+            ping = ServerSentEvent(comment="ping", sep=self.sep)
+            self.ping_message_factory = lambda: ping
 
 
 class CustomSseServerTransport(BaseSseServerTransport):
     """Custom SSE transport that doesn't URL encode the full endpoint URL"""
 
+    def __init__(self, endpoint: str, max_buffer_size: int = 64) -> None:
+        super().__init__(endpoint)
+        self._max_buffer_size = max_buffer_size
+
     @asynccontextmanager
-    async def connect_sse(self, scope: Scope, receive: Receive, send: Send):
+    async def connect_sse(
+        self, scope: Scope, receive: Receive, send: Send, endpoint: str | None = None
+    ):
         if scope["type"] != "http":
             raise ValueError("connect_sse can only handle HTTP requests")
 
@@ -36,25 +59,27 @@ class CustomSseServerTransport(BaseSseServerTransport):
         write_stream_reader: MemoryObjectReceiveStream[types.JSONRPCMessage]
 
         # Create the stream pairs
-        read_stream_writer, read_stream = anyio.create_memory_object_stream(0)
-        write_stream, write_stream_reader = anyio.create_memory_object_stream(0)
+        read_stream_writer, read_stream = anyio.create_memory_object_stream(
+            self._max_buffer_size
+        )
+        write_stream, write_stream_reader = anyio.create_memory_object_stream(
+            self._max_buffer_size
+        )
         sse_stream_writer, sse_stream_reader = anyio.create_memory_object_stream(0)
 
         session_id = uuid4()
         # Don't URL encode the endpoint URL, just append the session_id
-        session_uri = f"{self._endpoint}?session_id={session_id.hex}"
+        session_uri = f"{endpoint or self._endpoint}?session_id={session_id.hex}"
         self._read_stream_writers[session_id] = read_stream_writer
 
         async def sse_writer():
             async with sse_stream_writer, write_stream_reader:
                 await sse_stream_writer.send({"event": "endpoint", "data": session_uri})
-                async for message in write_stream_reader:
-                    await sse_stream_writer.send(
-                        {
-                            "event": "message",
-                            "data": message.model_dump_json(by_alias=True, exclude_none=True),
-                        }
-                    )
+                async for batch in iter_message_batches(write_stream_reader):
+                    frames = []
+                    for data in batch:
+                        frames += (_MESSAGE_EVENT_PREFIX, data, _EVENT_SUFFIX)
+                    await sse_stream_writer.send(b"".join(frames))
 
         async with anyio.create_task_group() as tg:
             # Use our custom response class instead of EventSourceResponse
@@ -67,39 +92,23 @@ class CustomSseServerTransport(BaseSseServerTransport):
 
 def create_sse_server(mcp: FastMCP):
     """Create a Starlette app that handles SSE connections and message handling"""
-    transport = None
+    sse = CustomSseServerTransport("/messages/")
 
     # Define handler functions
     async def handle_sse(request):
-        nonlocal transport
-        if transport is None:
-            # Get the base URL from the request
-            server_url = f"{request.url.scheme}://{request.url.netloc}"
-            # Don't URL encode the server_url or path separators
-            endpoint = f"{server_url}/messages/"
-            transport = CustomSseServerTransport(endpoint)
-
-        async with transport.connect_sse(
-            request.scope, request.receive, request._send
+        # Don't URL encode the server_url or path separators
+        endpoint = f"{request.url.scheme}://{request.url.netloc}/messages/"
+        async with sse.connect_sse(
+            request.scope, request.receive, request._send, endpoint=endpoint
         ) as streams:
             await mcp._mcp_server.run(
                 streams[0], streams[1], mcp._mcp_server.create_initialization_options()
             )
 
-    async def handle_messages(scope: Scope, receive: Receive, send: Send):
-        """Handle POST requests once the transport is initialized."""
-        if transport is None:
-            response = PlainTextResponse(
-                "SSE transport not initialized", status_code=503
-            )
-            await response(scope, receive, send)
-        else:
-            await transport.handle_post_message(scope, receive, send)
-
     # Create Starlette routes for SSE and message handling
     routes = [
         Route("/sse/", endpoint=handle_sse),
-        Mount("/messages/", app=handle_messages),
+        Mount("/messages/", app=sse.handle_post_message),
     ]
 
     # Create a Starlette app
@@ -1,12 +1,75 @@
 import json
+from contextlib import asynccontextmanager
 
+import anyio
+import httpx
+import mcp.types as types
 from fastapi.testclient import TestClient
+from sse_starlette.sse import AppStatus
 
-from app.main import app
+from app.http_stream import HttpStreamServerTransport, create_http_stream_server
+from app.main import app, mcp
+from app.sse import (
+    CustomEventSourceResponse,
+    CustomSseServerTransport,
+    create_sse_server,
+)
 
 client = TestClient(app)
 
 
+@asynccontextmanager
+async def open_stream(asgi_app, path, host="testserver"):
+    """Drive a streaming GET through ``asgi_app`` and yield its body chunks.
+
+    TestClient buffers whole responses, so it can't read from a stream that
+    stays open.
+    """
+    # sse-starlette keeps a module-level exit event bound to the first loop
+    AppStatus.should_exit_event = None
+    chunk_writer, chunks = anyio.create_memory_object_stream(100)
+    disconnected = anyio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            await chunk_writer.send(message["body"])
+
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", host.encode("latin-1"))],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+    }
+    with anyio.fail_after(5):
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(asgi_app, scope, receive, send)
+            yield chunks
+            disconnected.set()
+            tg.cancel_scope.cancel()
+
+
+async def post_to_session(asgi_app, endpoint, host="testserver", **kwargs):
+    """POST to the session behind ``endpoint`` through ``asgi_app``."""
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url=f"http://{host}"
+    ) as post_client:
+        return await post_client.post(
+            "/messages/?" + endpoint.partition("?")[2], **kwargs
+        )
+
+
 def test_root():
     response = client.get("/")
     assert response.status_code == 200
@@ -28,3 +91,151 @@ def test_http_stream_endpoint():
         first_line = next(response.iter_lines())
         data = json.loads(first_line)
         assert "endpoint" in data
+
+
+def test_http_stream_post_requires_known_session():
+    transport = HttpStreamServerTransport("http://testserver/http/messages/")
+    post_client = TestClient(transport.handle_post_message)
+    assert post_client.post("/", json={}).status_code == 400
+    response = post_client.post("/?session_id=not-a-uuid", json={})
+    assert response.status_code == 404
+
+
+def test_http_stream_sessions_across_hosts():
+    stream_app = create_http_stream_server(mcp)
+
+    async def connect_from_two_hosts():
+        async with (
+            open_stream(stream_app, "/stream/", "a.example") as first,
+            open_stream(stream_app, "/stream/", "b.example") as second,
+        ):
+            endpoints = [
+                json.loads(await chunks.receive())["endpoint"]
+                for chunks in (first, second)
+            ]
+            # Post to the first host's session through the second host
+            response = await post_to_session(
+                stream_app,
+                endpoints[0],
+                host="b.example",
+                json={"jsonrpc": "2.0", "method": "notifications/initialized"},
+            )
+        return endpoints, response.status_code
+
+    endpoints, status_code = anyio.run(connect_from_two_hosts)
+    assert endpoints[0].startswith("http://a.example/http/messages/?session_id=")
+    assert endpoints[1].startswith("http://b.example/http/messages/?session_id=")
+    assert status_code == 204
+
+
+def test_endpoint_preamble_escapes_host():
+    async def first_chunk(asgi_app, path, host):
+        async with open_stream(asgi_app, path, host) as chunks:
+            return await chunks.receive()
+
+    for host in ('ex"ample', "ex\xe4mple"):
+        line = anyio.run(first_chunk, create_http_stream_server(mcp), "/stream/", host)
+        endpoint = json.loads(line)["endpoint"]
+        assert endpoint.startswith(f"http://{host}/http/messages/?session_id=")
+
+        event = anyio.run(first_chunk, create_sse_server(mcp), "/sse/", host)
+        assert event.decode().startswith(
+            f"event: endpoint\r\ndata: http://{host}/messages/?session_id="
+        )
+
+
+def test_http_stream_post_validates_message():
+    stream_app = create_http_stream_server(mcp)
+
+    async def post_messages():
+        async with open_stream(stream_app, "/stream/") as chunks:
+            endpoint = json.loads(await chunks.receive())["endpoint"]
+            malformed = await post_to_session(stream_app, endpoint, content=b"not json")
+            valid = await post_to_session(
+                stream_app,
+                endpoint,
+                json={"jsonrpc": "2.0", "method": "notifications/initialized"},
+            )
+        return malformed.status_code, valid.status_code
+
+    assert anyio.run(post_messages) == (400, 204)
+
+
+def test_queued_messages_coalesce_into_one_chunk():
+    lines = [
+        b'{"method":"notifications/progress%d","jsonrpc":"2.0"}' % i for i in range(3)
+    ]
+
+    def burst_app(connect):
+        async def asgi_app(scope, receive, send):
+            async with connect(scope, receive, send) as (_, write_stream):
+                # Queue everything before the response gets to read any of it
+                for line in lines:
+                    write_stream.send_nowait(
+                        types.JSONRPCMessage.model_validate_json(line)
+                    )
+                await anyio.sleep_forever()
+
+        return asgi_app
+
+    async def read_burst(asgi_app):
+        async with open_stream(asgi_app, "/") as chunks:
+            await chunks.receive()  # endpoint preamble
+            return await chunks.receive()
+
+    transport = HttpStreamServerTransport("/messages/")
+    chunk = anyio.run(read_burst, burst_app(transport.connect_stream))
+    assert chunk == b"".join(line + b"\n" for line in lines)
+
+    transport = CustomSseServerTransport("/messages/")
+    chunk = anyio.run(read_burst, burst_app(transport.connect_sse))
+    assert chunk == b"".join(
+        b"event: message\r\ndata: " + line + b"\r\n\r\n" for line in lines
+    )
+
+
+def test_sse_response_keeps_caller_cache_control():
+    response = CustomEventSourceResponse(content=iter(()))
+    assert response.headers["Cache-Control"] == "no-store, no-transform"
+
+    headers = {"Cache-Control": "private, max-age=0"}
+    response = CustomEventSourceResponse(content=iter(()), headers=headers)
+    assert response.headers["Cache-Control"] == "private, max-age=0"
+
+
+def test_sse_ping_uses_response_separator():
+    for sep in ("\r\n", "\n"):
+        response = CustomEventSourceResponse(content=iter(()), sep=sep)
+        ping = response.ping_message_factory().encode()
+        assert ping == f": ping{sep}{sep}".encode()
+
+
+def test_http_stream_initialize_round_trip():
+    stream_app = create_http_stream_server(mcp)
+    initialize = {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "initialize",
+        "params": {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {},
+            "clientInfo": {"name": "test-client", "version": "1.0"},
+        },
+    }
+
+    async def initialize_session():
+        async with open_stream(stream_app, "/stream/") as chunks:
+            endpoint = json.loads(await chunks.receive())["endpoint"]
+            response = await post_to_session(stream_app, endpoint, json=initialize)
+            return response.status_code, json.loads(await chunks.receive())
+
+    status_code, reply = anyio.run(initialize_session)
+    assert status_code == 204
+    assert reply["id"] == 1
+    assert reply["result"]["protocolVersion"] == "2024-11-05"
+
+
+def test_http_stream_route_is_exact():
+    stream_client = TestClient(create_http_stream_server(mcp))
+    assert stream_client.get("/stream/x").status_code == 404
+    assert stream_client.post("/stream/").status_code == 405